@@ -1,20 +1,29 @@
 import os
 import re
 import sys
+import mmap
 import time
+import binascii
 import fcntl
+import hashlib
 import socket
 import select
 import signal
+import tempfile
+import posixpath
 import subprocess
 import paramiko
 import weakref
+import threading
 from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
 from unix.processes import Processes as _Processes
 from unix.path import Path as _Path, escape
 from unix.remote import Remote as _Remote
 from unix.users import Users as _Users
 from unix.groups import Groups as _Groups
+from unix.inotify import (Inotify as _Inotify, InotifyError as _InotifyError,
+                          IN_MODIFY, IN_CREATE, IN_MOVED_TO)
 from paramiko.py3compat import u, b
 
 if sys.version_info.major < 3:
@@ -46,6 +55,13 @@ def isvalid(host):
     if instances(host)[0] not in ('Local', 'Remote'):
         raise ValueError("this is not a 'Local' or a 'Remote' host")
 
+def _tail_paths(filepath):
+    """Return the list of files to follow for ``tail`` methods and whether
+    many files are followed."""
+    if isinstance(filepath, (list, tuple, set)):
+        return list(filepath), True
+    return [filepath], False
+
 
 #
 # Constants
@@ -74,6 +90,80 @@ _IPV6 = re.compile(r'^[0-9a-fA-F]{1,4}:[0-9a-fA-F]{1,4}:[0-9a-fA-F]{1,4}:'
                     '[0-9a-fA-F]{1,4}:[0-9a-fA-F]{1,4}:[0-9a-fA-F]{1,4}:'
                     '[0-9a-fA-F]{1,4}:[0-9a-fA-F]{1,4}$')
 
+# Maximum number of SFTP sessions opened (and kept) on a remote host.
+_SFTP_POOL_SIZE = 4
+
+# Size of SFTP read/write requests (paramiko never sends bigger requests) and
+# number of read requests kept in flight when transferring files.
+_SFTP_CHUNK_SIZE = 32768
+_SFTP_WINDOW = 64
+
+# Default value of ARG_MAX (if it can't be retrieved) and maximum length of a
+# single argument on Linux (MAX_ARG_STRLEN). As commands are passed to the
+# shell as one argument, a command line can't be longer than this.
+_ARG_MAX = 131072
+_ARG_STRLEN_MAX = 131072
+
+# Hash algorithms available for hashing files (both in 'hashlib' and with the
+# '<algo>sum' commands).
+_HASH_ALGOS = ('md5', 'sha1', 'sha224', 'sha256', 'sha384', 'sha512')
+
+# Shell script for reading many files at once. Each file is framed by a
+# header line with the status and the size of the content (or of the error
+# message). Files are first copied in a temporary file as the size of
+# pseudo-files is unknown.
+_READ_MANY_SCRIPT = '''t=$(mktemp) && e=$(mktemp) || exit 1
+trap 'rm -f "$t" "$e"' EXIT
+for f; do
+    if cat -- "$f" > "$t" 2> "$e"; then
+        printf 'OK %s\\n' $(wc -c < "$t"); cat "$t"
+    else
+        printf 'ERR %s\\n' $(wc -c < "$e"); cat "$e"
+    fi
+done'''
+
+# Mode of files created with 'atomic_open'.
+_NEW_FILE_MODE = 0o644
+
+# Script executed by the Python interpreter of a host for replacing a pattern
+# in a file (streaming the file line by line to a temporary file that replaces
+# it). The number of substitutions is printed.
+_REPLACE_SCRIPT = r'''
+import os
+import re
+import sys
+import tempfile
+
+path, pattern, replacement = sys.argv[1:4]
+regex = re.compile(pattern)
+dirname, basename = os.path.split(path)
+fd, tmppath = tempfile.mkstemp(prefix='.%s.' % basename, dir=dirname or '.')
+count = 0
+try:
+    with open(path, 'rb') as src:
+        with os.fdopen(fd, 'wb') as dst:
+            for line in src:
+                line, nb = regex.subn(replacement, line.decode('utf-8'))
+                count += nb
+                dst.write(line.encode('utf-8'))
+            dst.flush()
+            os.fsync(dst.fileno())
+    if count:
+        stat = os.stat(path)
+        os.chmod(tmppath, stat.st_mode & 4095)
+        try:
+            os.chown(tmppath, stat.st_uid, stat.st_gid)
+        except OSError:
+            pass
+        os.rename(tmppath, path)
+    else:
+        os.remove(tmppath)
+except:
+    os.remove(tmppath)
+    raise
+sys.stdout.write(str(count))
+'''
+
 
 #
 # Exceptions.
@@ -274,14 +364,14 @@ class Host(object):
 
     def touch(self, *paths, **options):
         paths = [escape(path) for path in paths]
-        return self.execute('touch', *paths, **options)
+        return self._execute_chunks('touch', [], paths, options)
 
     def mkdir(self, *paths, **options):
         """Create a directory. *args and **options contains options that can be
         passed to the command. **options can contain an additionnal key
         *INTERACTIVE* that will be pass to ``execute`` function."""
         paths = [escape(path) for path in paths]
-        return self.execute('mkdir', *paths, **options)
+        return self._execute_chunks('mkdir', [], paths, options)
 
     def copy(self, *paths, **options):
         """Copy **src** file or directory to **dst**. *paths and **options
@@ -289,27 +379,98 @@ class Host(object):
         contain an additionnal key *INTERACTIVE* that will be pass to
         ``execute`` function."""
         paths = [escape(path) for path in paths]
-        return self.execute('cp', *paths, **options)
+        return self._execute_chunks('cp', [], paths[:-1], options, paths[-1:])
 
     def move(self, *paths, **options):
         paths = [escape(path) for path in paths]
-        return self.execute('mv', *paths, **options)
+        return self._execute_chunks('mv', [], paths[:-1], options, paths[-1:])
 
     def remove(self, *paths, **options):
         paths = [escape(path) for path in paths]
-        return self.execute('rm', *paths, **options)
+        return self._execute_chunks('rm', [], paths, options)
 
     def chmod(self, permissions, *paths, **options):
         paths = [escape(path) for path in paths]
-        return self.execute('chmod', permissions, *paths, **options)
+        return self._execute_chunks('chmod', [permissions], paths, options)
 
     def chown(self, owner, *paths, **options):
         paths = [escape(path) for path in paths]
-        return self.execute('chown', owner, *paths, **options)
+        return self._execute_chunks('chown', [owner], paths, options)
 
     def chgrp(self, group, *paths, **options):
         paths = [escape(path) for path in paths]
-        return self.execute('chgrp', group, *path, **options)
+        return self._execute_chunks('chgrp', [group], paths, options)
+
+    @property
+    def arg_max(self):
+        """Maximum length of the arguments of a command (``getconf ARG_MAX``).
+        The value is retrieved once and cached."""
+        if getattr(self, '_arg_max', None) is None:
+            status, stdout = self.execute('getconf', 'ARG_MAX')[:2]
+            self._arg_max = int(stdout) if status else _ARG_MAX
+        return self._arg_max
+
+    def _split_args(self, args, reserved=0):
+        """Split **args** in chunks that can be passed to a command without
+        exceeding the limits of the host. **reserved** is the length of the
+        command line without these arguments."""
+        # Keep half of ARG_MAX for the environment.
+        limit = min(self.arg_max // 2, _ARG_STRLEN_MAX) - reserved - 4096
+        chunk, length = [], 0
+        for arg in args:
+            size = len(quote(str(arg))) + 1
+            if chunk and length + size > limit:
+                yield chunk
+                chunk, length = [], 0
+            chunk.append(arg)
+            length += size
+        if chunk:
+            yield chunk
+
+    def _execute_chunks(self, command, args, paths, options, last_args=()):
+        """Execute **command** with **args**, **paths** and **last_args** as
+        arguments. If there are too many paths for one command line, paths are
+        split in chunks (see ``_split_args``) and the command is executed for
+        each chunk, in parallel (the special option *PARALLEL* set the number
+        of commands executed at the same time, 4 by default) unless the
+        *timeout* control is set. The result is a ``ChunksResult``."""
+        parallel = options.pop('PARALLEL', 4)
+        if self._timeout:
+            # Timeouts are implemented with signals which only works in the
+            # main thread.
+            parallel = 1
+        reserved = (len(command)
+                    + sum(len(quote(str(arg))) + 1
+                          for arg in list(args) + list(last_args))
+                    + sum(len(str(option)) + len(str(value)) + 4
+                          for option, value in options.items()))
+        chunks = list(self._split_args(paths, reserved)) or [[]]
+
+        def execute(chunk):
+            return self.execute(command, *(list(args) + chunk + list(last_args)),
+                                **dict(options))
+
+        if parallel > 1 and len(chunks) > 1:
+            pool = ThreadPool(min(parallel, len(chunks)))
+            try:
+                results = pool.map(execute, chunks)
+            finally:
+                pool.close()
+        else:
+            results = [execute(chunk) for chunk in chunks]
+        return ChunksResult(chunks, results)
+
+    def _python(self):
+        """Return the Python interpreter of the host (the result is
+        cached)."""
+        if getattr(self, '_python_interpreter', None) is None:
+            for interpreter in ('python3', 'python', 'python2'):
+                if self.execute('which', interpreter)[0]:
+                    self._python_interpreter = interpreter
+                    break
+            else:
+                raise UnixError('unable to find a Python interpreter')
+        return self._python_interpreter
 
     def which(self, command, **options):
         try:
@@ -325,6 +486,36 @@ class Host(object):
         with self.open(filepath, 'w') as fhandler:
             fhandler.write(content)
 
+    def read_many(self, paths):
+        """Read many files at once and return a dictionnary with the content
+        (bytes) of each file or the exception (``IOError``) raised when
+        reading it. Files are read by a shell script streaming their framed
+        contents so there is one execution for as many files as the command
+        line can contain."""
+        paths = list(paths)
+        result = {}
+        for chunk in self._split_args(paths, len(_READ_MANY_SCRIPT) + 16):
+            with self.set_controls(decode=None, escape_args=True):
+                status, stdout, stderr = self.execute('sh', '-c', _READ_MANY_SCRIPT,
+                                                      'sh', *chunk)
+            if not status:
+                raise UnixError(stderr.decode())
+
+            offset = 0
+            for path in chunk:
+                end = stdout.index(b'\n', offset)
+                code, size = stdout[offset:end].split()
+                offset = end + 1 + int(size)
+                content = stdout[end + 1:offset]
+                result[path] = (content
+                                if code == b'OK'
+                                else IOError(content.decode().strip()))
+        return result
+
+    def transfer(self, src_host, src_path, dst_host, dst_path, **kwargs):
+        """Copy files between two hosts (see ``unix.remote.Remote.transfer``)."""
+        return self.remote.transfer(src_host, src_path, dst_host, dst_path, **kwargs)
+
     def mount(self, device, mount_point, **options):
         mount_point = escape(mount_point)
         return self.execute('mount', device, mount_point, **options)
@@ -341,15 +532,75 @@ class Host(object):
         finally:
             self.umount(mount_point)
 
-    def replace(self, filepath, pattern, replacement, backup=None):
-        with self.open(filepath) as fhandler:
-            new_content = re.sub(pattern, replacement, fhandler.read().decode())
+    def replace(self, filepath, pattern, replacement, backup=None,
+                stream=False, on_host=False):
+        """Replace **pattern** by **replacement** in **filepath** (see
+        ``re.sub``). The second element of the result is the number of
+        substitutions.
+
+        By default, the whole file is read, modified and written back. With
+        **stream**, the file is processed line by line (so the pattern must
+        not match more than one line) into a temporary file that atomically
+        replaces the file if there were substitutions. With **on_host**, the
+        file is processed the same way by the Python interpreter of the host
+        so its content is never transferred."""
         if backup:
-            if not self.copy(filepath, '%s.%s' % (filepath, backup)):
+            if not self.copy(filepath, '%s.%s' % (filepath, backup))[0]:
                 return [False, '', 'unable to backup file']
+
+        if on_host:
+            if callable(replacement):
+                raise UnixError('replacement must be a string for replacing '
+                                'on the host')
+            with self.set_controls(escape_args=True, decode='utf-8'):
+                status, stdout, stderr = self.execute(self._python(), '-c',
+                                                      _REPLACE_SCRIPT,
+                                                      filepath, pattern,
+                                                      replacement)
+            return [status, int(stdout) if status else 0, stderr]
+
+        if stream:
+            regex = re.compile(pattern)
+            count = 0
+            try:
+                with self.open(filepath) as src:
+                    with self.atomic_open(filepath) as dst:
+                        for line in src:
+                            line, nb = regex.subn(replacement, line.decode())
+                            count += nb
+                            dst.write(line.encode())
+                        if not count:
+                            raise _NoChange()
+            except _NoChange:
+                pass
+            return [True, count, '']
+
+        with self.open(filepath) as fhandler:
+            new_content, count = re.subn(pattern, replacement, fhandler.read().decode())
         with self.open(filepath, 'w') as fhandler:
-            fhandler.write(new_content)
-        return [True, '', '']
+            fhandler.write(new_content.encode())
+        return [True, count, '']
+
+
+class ChunksResult(list):
+    """Result of a command executed on chunks of arguments. This is the usual
+    list of three elements (status, stdout and stderr) aggregating the
+    results of each execution (the status is *True* only if all executions
+    succeeded) with an additional ``failures`` attribute listing the
+    (arguments, stderr) of the failed executions."""
+    def __init__(self, chunks, results):
+        self.failures = [(chunk, result[2])
+                         for chunk, result in zip(chunks, results)
+                         if not result[0]]
+        empty = results[0][1][:0]
+        list.__init__(self, [not self.failures,
+                             empty.join(result[1] for result in results),
+                             empty.join(result[2] for result in results)])
+
+
+class _NoChange(Exception):
+    """Exception used for cancelling the replacement of a file by
+    ``atomic_open``."""
 
 
 #
@@ -444,6 +695,17 @@ class Local(Host):
         self.return_code = process.returncode
         yield (u'status', True if self.return_code == 0 else False)
 
+    def popen(self, command, *args, **options):
+        """Execute a command without waiting for it and return the
+        ``subprocess.Popen`` object allowing to stream data (in binary mode)
+        to its standard input and from its outputs."""
+        command = self._format_command(command, args, options)
+        return subprocess.Popen(command,
+                                shell=True,
+                                stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE)
+
     def open(self, filepath, mode='r'):
         # For compatibility with SFTPClient object, the file is always open
         # in binary mode.
@@ -451,22 +713,270 @@ class Local(Host):
             mode += 'b'
         return open(filepath, mode)
 
-    def tail(self, filepath, delta=1):
-        prev_size = os.stat(filepath).st_size
-        while 1:
-            cur_size = os.stat(filepath).st_size
-            # File has been rotate.
-            if cur_size < prev_size:
-                with self.open(filepath) as fhandler:
-                    for line in fhandler.read().splitlines():
-                        yield line
+    @contextmanager
+    def mmap(self, filepath):
+        """Map **filepath** in memory (read-only) and return the ``mmap``
+        object. Empty files and pseudo-files (whose size is null) can't be
+        mapped."""
+        with self.open(filepath) as fhandler:
+            content = mmap.mmap(fhandler.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            yield content
+        finally:
+            try:
+                content.close()
+            except BufferError:
+                # A view on the content is still used somewhere.
+                pass
+
+    @contextmanager
+    def read_view(self, filepath):
+        """Return a read-only ``memoryview`` on the content of **filepath**
+        which can be used only inside the ``with`` block. The file is mapped
+        in memory if possible so its content is not copied."""
+        with self.open(filepath) as fhandler:
+            if os.fstat(fhandler.fileno()).st_size:
+                content = mmap.mmap(fhandler.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                content = fhandler.read()
+        view = memoryview(content)
+        try:
+            yield view
+        finally:
+            view.release()
+            if isinstance(content, mmap.mmap):
+                try:
+                    content.close()
+                except BufferError:
+                    pass
+
+    @contextmanager
+    def atomic_open(self, filepath, mode='w'):
+        """Open (in binary mode) a temporary file in the directory of
+        **filepath** that replaces **filepath** (keeping its permissions and
+        its owner) if no exception occured when closing it."""
+        dirname, basename = os.path.split(filepath)
+        fd, tmppath = tempfile.mkstemp(prefix='.%s.' % basename, dir=dirname or '.')
+        try:
+            if os.path.exists(filepath):
+                stat = os.stat(filepath)
+                os.fchmod(fd, stat.st_mode & 0o7777)
+                try:
+                    os.fchown(fd, stat.st_uid, stat.st_gid)
+                except OSError:
+                    pass
             else:
-                with self.open(filepath) as fhandler:
-                    fhandler.seek(prev_size, 0)
-                    for line in fhandler.read().splitlines():
-                        yield line
-            prev_size = cur_size
-            time.sleep(delta)
+                os.fchmod(fd, _NEW_FILE_MODE)
+            with os.fdopen(fd, 'wb') as fhandler:
+                yield fhandler
+                fhandler.flush()
+                os.fsync(fhandler.fileno())
+            os.rename(tmppath, filepath)
+        except BaseException:
+            try:
+                os.remove(tmppath)
+            except OSError:
+                pass
+            raise
+
+    def read_many(self, paths, parallel=4):
+        """Read many files at once and return a dictionnary with the content
+        (bytes) of each file or the exception raised when reading it. Files
+        are read in **parallel** threads."""
+        def read(path):
+            try:
+                with self.open(path) as fhandler:
+                    return fhandler.read()
+            except (IOError, OSError) as err:
+                return err
+
+        paths = list(paths)
+        if parallel > 1 and len(paths) > 1:
+            pool = ThreadPool(min(parallel, len(paths)))
+            try:
+                return dict(zip(paths, pool.map(read, paths)))
+            finally:
+                pool.close()
+        return {path: read(path) for path in paths}
+
+    def hash(self, paths, algo='sha256', cache=None, parallel=4):
+        """Return a dictionnary with the hexadecimal digest of each file of
+        **paths** (or *None* if the file can't be read). Files are mapped in
+        memory and hashed in **parallel** threads. **cache** is an optional
+        dictionnary (dedicated to this host) used for not hashing again files
+        whose size, modification time and inode didn't change."""
+        if algo not in _HASH_ALGOS:
+            raise UnixError("invalid hash algorithm '%s'" % algo)
+
+        def hash_file(path):
+            try:
+                with self.open(path) as fhandler:
+                    stat = os.fstat(fhandler.fileno())
+                    key = (algo, path, stat.st_size, stat.st_mtime, stat.st_ino)
+                    if cache is not None and key in cache:
+                        return cache[key]
+                    digest = hashlib.new(algo)
+                    if stat.st_size:
+                        content = mmap.mmap(fhandler.fileno(), 0,
+                                            access=mmap.ACCESS_READ)
+                        try:
+                            digest.update(content)
+                        finally:
+                            content.close()
+                    digest = digest.hexdigest()
+                    if cache is not None:
+                        cache[key] = digest
+                    return digest
+            except (IOError, OSError, ValueError):
+                return None
+
+        paths = list(paths)
+        if parallel > 1 and len(paths) > 1:
+            pool = ThreadPool(min(parallel, len(paths)))
+            try:
+                return dict(zip(paths, pool.map(hash_file, paths)))
+            finally:
+                pool.close()
+        return {path: hash_file(path) for path in paths}
+
+    def tail(self, filepath, delta=1):
+        """Follow **filepath** and yield lines as they are appended to it.
+        **filepath** can also be a list of files, in which case
+        (filepath, line) tuples are yielded.
+
+        Files are kept open and changes are notified by ``inotify`` (files
+        are also checked every **delta** seconds or only checked every
+        **delta** seconds if ``inotify`` is not available). Rotated files
+        (detected by their inode) and truncated files are read from the
+        beginning."""
+        paths, multiple = _tail_paths(filepath)
+        files = [_TailedFile(path) for path in paths]
+        try:
+            notifier = _Inotify()
+        except _InotifyError:
+            notifier = None
+
+        watches = {}
+        try:
+            if notifier is not None:
+                for tailed in files:
+                    dirname = os.path.dirname(os.path.abspath(tailed.path))
+                    wd = notifier.add_watch(dirname,
+                                            IN_MODIFY | IN_CREATE | IN_MOVED_TO)
+                    watches.setdefault(wd, []).append(tailed)
+
+            while 1:
+                ready = files
+                if notifier is not None:
+                    events = set((wd, name)
+                                 for wd, _, _, name in notifier.read(delta))
+                    if events:
+                        ready = [tailed
+                                 for wd, tailed_files in watches.items()
+                                 for tailed in tailed_files
+                                 if (wd, os.path.basename(tailed.path)) in events]
+                else:
+                    time.sleep(delta)
+
+                for tailed in ready:
+                    for line in tailed.readlines():
+                        yield (tailed.path, line) if multiple else line
+        finally:
+            if notifier is not None:
+                notifier.close()
+            for tailed in files:
+                tailed.close()
+
+
+class _TailedFile(object):
+    """File followed by ``Local.tail``. The file is kept open and is reopened
+    when it has been rotated."""
+    def __init__(self, path):
+        self.path = path
+        self._pending = b''
+        self._open()
+        self._fhandler.seek(0, 2)
+
+    def _open(self):
+        self._fhandler = open(self.path, 'rb', 0)
+        stat = os.fstat(self._fhandler.fileno())
+        self._inode = (stat.st_dev, stat.st_ino)
+
+    def _read(self):
+        chunks = []
+        while True:
+            chunk = self._fhandler.read(65536)
+            if not chunk:
+                return b''.join(chunks)
+            chunks.append(chunk)
+
+    def readlines(self):
+        """Return the complete lines appended since the last call."""
+        data = self._read()
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            # The file has been rotated but not yet recreated.
+            stat = None
+
+        if stat is not None and (stat.st_dev, stat.st_ino) != self._inode:
+            self._fhandler.close()
+            self._open()
+            data += self._read()
+        elif stat is not None and stat.st_size < self._fhandler.tell():
+            self._fhandler.seek(0, 0)
+            data += self._read()
+
+        lines = (self._pending + data).split(b'\n')
+        self._pending = lines.pop()
+        return lines
+
+    def close(self):
+        self._fhandler.close()
+
+
+#
+# Classes for streaming data to and from a command executed on a remote host.
+#
+class _ChannelStdin(object):
+    """Standard input of a command executed on a SSH channel. Closing it
+    sends EOF to the command."""
+    def __init__(self, chan):
+        self._chan = chan
+
+    def write(self, data):
+        self._chan.sendall(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if not self._chan.closed:
+            self._chan.shutdown_write()
+
+
+class _RemoteProcess(object):
+    """Command executed on a SSH channel. This implements the parts of
+    ``subprocess.Popen`` interface needed for streaming data."""
+    def __init__(self, chan):
+        self._chan = chan
+        self.stdin = _ChannelStdin(chan)
+        self.stdout = chan.makefile('rb', -1)
+        self.stderr = chan.makefile_stderr('rb', -1)
+        self.returncode = None
+
+    def poll(self):
+        if self.returncode is None and self._chan.exit_status_ready():
+            self.returncode = self._chan.recv_exit_status()
+        return self.returncode
+
+    def wait(self):
+        if self.returncode is None:
+            self.returncode = self._chan.recv_exit_status()
+        return self.returncode
+
+    def kill(self):
+        self._chan.close()
 
 
 #
@@ -505,6 +1015,8 @@ class Remote(Host):
         self.fqdn = None
         self.username = None
         self._conn = None
+        self._sftp = {}
+        self._sftp_lock = threading.Lock()
 
     @staticmethod
     def clone(host):
@@ -516,6 +1028,9 @@ class Remote(Host):
         new_host.__dict__.update({attr: getattr(host, attr) for attr in attrs})
         if hasattr(host, '_conn'):
             new_host.__dict__.update(_conn=host._conn)
+        # SFTP sessions are bound to the connection so share them too.
+        if hasattr(host, '_sftp'):
+            new_host.__dict__.update(_sftp=host._sftp, _sftp_lock=host._sftp_lock)
         return new_host
 
     def __ipv4(self):
@@ -591,6 +1106,13 @@ class Remote(Host):
             self.default_shell = self.execute('echo $0')[1].strip()
 
     def disconnect(self):
+        with self._sftp_lock:
+            for sftp in self._sftp.values():
+                try:
+                    sftp.close()
+                except Exception:
+                    pass
+            self._sftp.clear()
         self._conn.close()
 
     def is_connected(self):
@@ -696,33 +1218,236 @@ class Remote(Host):
                     self.return_code = chan.recv_exit_status()
                     yield ('status', True if self.return_code == 0 else False)
 
-    def open(self, filepath, mode='r'):
+    def popen(self, command, *args, **options):
+        """Execute a command without waiting for it and return an object
+        implementing the main parts of the ``subprocess.Popen`` interface
+        (``stdin``, ``stdout``, ``stderr``, ``poll``, ``wait``) for streaming
+        data (in binary mode) to and from the command."""
+        self.is_connected()
+        chan = self._conn.get_transport().open_session()
+        chan.exec_command(self._format_command(command, args, options))
+        return _RemoteProcess(chan)
+
+    def _get_sftp(self, index=0):
+        """Return the SFTP session **index** of the pool, opening it on first
+        use or if its channel has been closed (transport loss, server side
+        timeout, ...). Sessions are closed on ``disconnect``."""
         self.is_connected()
-        sftp = paramiko.SFTPClient.from_transport(self._conn.get_transport())
+        index %= _SFTP_POOL_SIZE
+        with self._sftp_lock:
+            sftp = self._sftp.get(index)
+            if sftp is None or sftp.get_channel().closed:
+                transport = self._conn.get_transport()
+                if not transport.is_active():
+                    raise UnixError(_NOT_CONNECTED_ERR)
+                sftp = paramiko.SFTPClient.from_transport(transport)
+                self._sftp[index] = sftp
+            return sftp
+
+    def open(self, filepath, mode='r', bufsize=-1, session=0):
+        sftp = self._get_sftp(session)
         # File is always open in binary mode but 'readline' function decode
         # the line if the binary mode is not specified! So force the binary mode
         # for letting client program decoding lines.
         if 'b' not in mode:
             mode += 'b'
-        return sftp.open(filepath, mode)
+        return sftp.open(filepath, mode, bufsize)
+
+    def read(self, filepath):
+        with self.open(filepath) as fhandler:
+            # Pseudo-files (like in /proc) have a null size and can't be
+            # prefetched.
+            size = fhandler.stat().st_size
+            if size:
+                fhandler.prefetch(size)
+            return fhandler.read().decode()
+
+    def write(self, filepath, content):
+        if not isinstance(content, bytes):
+            content = content.encode()
+        self.writefrom(filepath, content)
+
+    def readinto(self, filepath, buffer, chunk_size=_SFTP_CHUNK_SIZE,
+                 window=_SFTP_WINDOW, parallel=1):
+        """Read the content of **filepath** directly into **buffer** (any
+        writable object implementing the buffer protocol, like a ``bytearray``
+        or a ``mmap``) and return the number of bytes read.
+
+        Read requests of **chunk_size** bytes are pipelined with at most
+        **window** requests in flight. If **parallel** is greater than 1, the
+        file is split in ranges that are read concurrently on distinct SFTP
+        sessions, which helps for very large files."""
+        view = memoryview(buffer)
+        with self.open(filepath) as fhandler:
+            size = min(fhandler.stat().st_size, len(view))
+        if not size:
+            return 0
+
+        # Split the file in ranges aligned on chunks.
+        parallel = max(1, min(parallel, _SFTP_POOL_SIZE))
+        nb_chunks = -(-size // chunk_size)
+        range_size = -(-nb_chunks // parallel) * chunk_size
+        ranges = [(start, min(start + range_size, size))
+                  for start in range(0, size, range_size)]
+
+        def read_range(args):
+            session, (start, end) = args
+            requests = [(offset, min(chunk_size, end - offset))
+                        for offset in range(start, end, chunk_size)]
+            nbytes = 0
+            with self.open(filepath, session=session) as fhandler:
+                for index in range(0, len(requests), window):
+                    batch = requests[index:index + window]
+                    for (offset, _), data in zip(batch, fhandler.readv(batch)):
+                        view[offset:offset + len(data)] = data
+                        nbytes += len(data)
+            return nbytes
+
+        if len(ranges) == 1:
+            return read_range((0, ranges[0]))
+        pool = ThreadPool(len(ranges))
+        try:
+            return sum(pool.map(read_range, enumerate(ranges)))
+        finally:
+            pool.close()
+
+    def writefrom(self, filepath, buffer, mode='w', chunk_size=_SFTP_CHUNK_SIZE):
+        """Write the content of **buffer** (any object implementing the buffer
+        protocol) to **filepath** and return the number of bytes written.
+
+        Data is sent by slices of **chunk_size** bytes without being copied
+        and write requests are pipelined (server acknowledgements are only
+        checked when the file is closed)."""
+        view = memoryview(buffer)
+        with self.open(filepath, mode, bufsize=chunk_size) as fhandler:
+            fhandler.set_pipelined(True)
+            for offset in range(0, len(view), chunk_size):
+                fhandler.write(view[offset:offset + chunk_size])
+        return len(view)
+
+    @contextmanager
+    def read_view(self, filepath):
+        """Return a ``memoryview`` on the content of **filepath** which can be
+        used only inside the ``with`` block. The file is read (with pipelined
+        requests) in a buffer allocated once."""
+        with self.open(filepath) as fhandler:
+            size = fhandler.stat().st_size
+            # Pseudo-files have a null size.
+            if not size:
+                content = fhandler.read()
+        if size:
+            content = bytearray(size)
+            content = memoryview(content)[:self.readinto(filepath, content)]
+        view = memoryview(content)
+        try:
+            yield view
+        finally:
+            view.release()
+
+    @contextmanager
+    def atomic_open(self, filepath, mode='w'):
+        """Open (in binary mode) a temporary file in the directory of
+        **filepath** that replaces **filepath** (keeping its permissions and
+        its owner) if no exception occured when closing it."""
+        sftp = self._get_sftp()
+        dirname, basename = posixpath.split(filepath)
+        tmppath = posixpath.join(dirname, '.%s.%s' % (basename,
+                                                      binascii.hexlify(os.urandom(4)).decode()))
+        try:
+            stat = sftp.stat(filepath)
+        except IOError:
+            stat = None
+
+        try:
+            with sftp.open(tmppath, 'wbx') as fhandler:
+                fhandler.chmod(stat.st_mode & 0o7777 if stat else _NEW_FILE_MODE)
+                if stat is not None:
+                    try:
+                        fhandler.chown(stat.st_uid, stat.st_gid)
+                    except IOError:
+                        pass
+                fhandler.set_pipelined(True)
+                yield fhandler
+            sftp.posix_rename(tmppath, filepath)
+        except BaseException:
+            try:
+                sftp.remove(tmppath)
+            except IOError:
+                pass
+            raise
+
+    def hash(self, paths, algo='sha256', cache=None):
+        """Return a dictionnary with the hexadecimal digest of each file of
+        **paths** (or *None* if the file can't be read). Files are hashed on
+        the host by executing ``<algo>sum`` on as many files as possible at
+        once. **cache** is an optional dictionnary (dedicated to this host)
+        used for not hashing again files whose size, modification time and
+        inode didn't change (they are retrieved by ``stat``)."""
+        if algo not in _HASH_ALGOS:
+            raise UnixError("invalid hash algorithm '%s'" % algo)
+        paths = list(paths)
+        result = dict.fromkeys(paths)
+
+        keys = {}
+        if cache is not None:
+            for chunk in self._split_args(paths, 64):
+                with self.set_controls(decode='utf-8'):
+                    stdout = self.execute('stat', '--format=%s %Y %i %n', '--', *chunk)[1]
+                for line in stdout.splitlines():
+                    size, mtime, inode, path = line.split(' ', 3)
+                    keys[path] = (algo, path, int(size), int(mtime), int(inode))
+                    result[path] = cache.get(keys[path])
+        to_hash = [path for path in paths if result[path] is None]
+
+        command = '%ssum' % algo
+        digest_size = hashlib.new(algo).digest_size * 2
+        for chunk in self._split_args(to_hash, 64):
+            with self.set_controls(decode='utf-8'):
+                stdout = self.execute(command, '--', *chunk)[1]
+            for line in stdout.splitlines():
+                # Names with special characters are escaped and the line
+                # starts with a backslash.
+                line = line[1:] if line.startswith('\\') else line
+                digest, path = line[:digest_size], line[digest_size + 2:]
+                result[path] = digest
+                if path in keys:
+                    cache[keys[path]] = digest
+        return result
 
     def tail(self, filepath, delta=1):
-        sftp = paramiko.SFTPClient.from_transport(self._conn.get_transport())
-
-        prev_size = sftp.stat(filepath).st_size
-        while 1:
-            with timeout(self._timeout):
-                cur_size = sftp.stat(filepath).st_size
-
-                # File has been rotate.
-                if cur_size < prev_size:
-                    with self.open(filepath) as fhandler:
-                        for line in fhandler.read().splitlines():
-                            yield line.decode()
-                else:
-                    with self.open(filepath) as fhandler:
-                        fhandler.seek(prev_size, 0)
-                        for line in fhandler.read().splitlines():
-                            yield line.decode()
-                prev_size = cur_size
-            time.sleep(delta)
+        """Follow **filepath** (or a list of files, in which case
+        (filepath, line) tuples are yielded) and yield lines as they are
+        appended to it. A single ``tail -F`` command is executed for
+        following all the files and its output is streamed; **delta** is the
+        interval of ``tail`` checks when it can't use ``inotify``."""
+        paths, multiple = _tail_paths(filepath)
+        header_re = re.compile(br'^==> (.*) <==$')
+        current = paths[0]
+        with self._get_chan() as chan:
+            command = self._format_command(
+                'tail', ['-F', '-n', '0', '-s', str(delta)] + paths, {})
+            chan.exec_command(command)
+
+            pending = b''
+            separator = False
+            while 1:
+                data = chan.recv(32768)
+                if not data:
+                    break
+                lines = (pending + data).split(b'\n')
+                pending = lines.pop()
+                for line in lines:
+                    # With many files, 'tail' prints the name of the file
+                    # (preceded by an empty line) before its lines.
+                    regex = header_re.match(line) if multiple else None
+                    if regex is not None and regex.group(1).decode() in paths:
+                        current = regex.group(1).decode()
+                        separator = False
+                        continue
+                    if separator:
+                        yield (current, u'') if multiple else u''
+                    separator = multiple and not line
+                    if separator:
+                        continue
+                    line = line.decode()
+                    yield (current, line) if multiple else line
@@ -0,0 +1,109 @@
+import sys
+import unix
+
+if sys.version_info.major < 3:
+    from pipes import quote
+else:
+    from shlex import quote
+
+# /etc/passwd fields.
+PASSWD_FIELDS = ('login', 'password', 'uid', 'gid', 'name', 'home', 'shell')
+
+# /etc/group fields.
+GROUP_FIELDS = ('name', 'password', 'gid', 'users')
+
+
+class Accounts(object):
+    """Snapshot of the users and groups databases of a host loaded with one
+    execution of ``getent``. Users and groups are indexed by name and by id
+    and groups of each user are indexed too."""
+    def __init__(self, host):
+        with host.set_controls(decode='utf-8'):
+            status, stdout, stderr = host.execute(
+                'sh', '-c', 'getent passwd && echo && getent group')
+        if not status:
+            raise unix.UnixError(stderr)
+        passwd, group = stdout.split('\n\n', 1)
+
+        self.users, self.uids = {}, {}
+        for line in passwd.splitlines():
+            user = dict(zip(PASSWD_FIELDS, line.split(':')))
+            self.users.setdefault(user['login'], user)
+            self.uids.setdefault(user['uid'], user)
+
+        self.groups, self.gids, self.members = {}, {}, {}
+        for line in group.splitlines():
+            group = dict(zip(GROUP_FIELDS, line.split(':')))
+            self.groups.setdefault(group['name'], group)
+            self.gids.setdefault(group['gid'], group)
+            for username in filter(None, group.get('users', '').split(',')):
+                self.members.setdefault(username, []).append(int(group['gid']))
+
+    def user(self, user):
+        """Return the user (by login or uid) or *None*."""
+        user = str(user)
+        return self.users.get(user, self.uids.get(user))
+
+    def group(self, group):
+        """Return the group (by name or gid) or *None*."""
+        group = str(group)
+        return self.groups.get(group, self.gids.get(group))
+
+    def user_groups(self, username):
+        """Return the gids of the groups of **username** (starting with its
+        primary group) or *None* if the user is unknown."""
+        user = self.users.get(username)
+        if user is None:
+            return None
+        gid = int(user['gid'])
+        return [gid] + [group_gid
+                        for group_gid in self.members.get(username, [])
+                        if group_gid != gid]
+
+    def group_users(self, groupname):
+        """Return the users whose primary or supplementary group is
+        **groupname** or *None* if the group is unknown."""
+        group = self.groups.get(groupname)
+        if group is None:
+            return None
+        users = [username for username in group['users'].split(',') if username]
+        users.extend(user['login']
+                     for user in self.users.values()
+                     if user['gid'] == group['gid'] and user['login'] not in users)
+        return users
+
+
+def snapshot(host):
+    """Return the snapshot of the accounts of **host**, loading it if there
+    is none (or if it has been invalidated)."""
+    if getattr(host, '_accounts', None) is None:
+        host._accounts = Accounts(host)
+    return host._accounts
+
+
+def invalidate(host):
+    """Invalidate the snapshot of the accounts of **host**."""
+    host._accounts = None
+
+
+def run(host, commands):
+    """Execute **commands** (lists of arguments) on **host** in one shell
+    script stopping at the first failure, and invalidate the snapshot. A
+    command can also be a string which is added as is to the script."""
+    if not commands:
+        return [True, u'', u'']
+    script = '\n'.join(['set -e'] + [
+        command if isinstance(command, str)
+        else ' '.join(quote(str(arg)) for arg in command)
+        for command in commands])
+    invalidate(host)
+    with host.set_controls(escape_args=True, decode='utf-8'):
+        return host.execute('sh', '-c', script)
+
+
+def chpasswd(passwords):
+    """Return the script command setting all hashed **passwords** (a dictionary
+    associating users to their hashed password) with one ``chpasswd``."""
+    lines = ['%s:%s' % (username, password)
+             for username, password in sorted(passwords.items())]
+    return "chpasswd -e <<'__UNIX_EOF__'\n%s\n__UNIX_EOF__" % '\n'.join(lines)
@@ -0,0 +1,218 @@
+"""Delta synchronization of files between hosts (rsync algorithm).
+
+Checksums of the blocks of the destination file are computed on the
+destination host, blocks of the source file matching them are searched using
+a rolling checksum and only unmatched data and references to matched blocks
+are sent to the destination host where the file is rebuilt."""
+import io
+import zlib
+import struct
+import hashlib
+import unix
+
+# Default size of blocks.
+BLOCK_SIZE = 4096
+
+# Maximum size of a literal data operation.
+_LITERAL_MAX = 1048576
+
+# Modulo of the Adler-32 checksum.
+_ADLER_MOD = 65521
+
+# Size of the signature of a block (weak checksum + MD5 digest).
+_SIGNATURE_SIZE = 20
+
+# Code executed on the destination host (or locally for local hosts) for
+# computing signatures of the blocks of a file and for rebuilding a file from
+# a delta. It must work with any version of Python and without any additional
+# module.
+_SCRIPT = r'''
+import os
+import sys
+import zlib
+import struct
+import hashlib
+import tempfile
+
+
+def signature(path, block_size, out):
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb') as fhandler:
+        while True:
+            block = fhandler.read(block_size)
+            if not block:
+                break
+            out.write(struct.pack('>I', zlib.adler32(block) & 0xffffffff)
+                      + hashlib.md5(block).digest())
+
+
+def _read(stream, size):
+    data = stream.read(size)
+    if len(data) != size:
+        raise IOError('truncated delta')
+    return data
+
+
+def patch(path, block_size, stream):
+    dirname, basename = os.path.split(path)
+    fd, tmppath = tempfile.mkstemp(prefix='.%s.' % basename, dir=dirname or '.')
+    try:
+        basis = open(path, 'rb') if os.path.exists(path) else None
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                while True:
+                    op = _read(stream, 1)
+                    if op == b'E':
+                        break
+                    value = struct.unpack('>I', _read(stream, 4))[0]
+                    if op == b'R':
+                        basis.seek(value * block_size)
+                        out.write(basis.read(block_size))
+                    else:
+                        out.write(_read(stream, value))
+                out.flush()
+                os.fsync(out.fileno())
+        finally:
+            if basis is not None:
+                basis.close()
+        if os.path.exists(path):
+            stat = os.stat(path)
+            os.chmod(tmppath, stat.st_mode & 4095)
+            try:
+                os.chown(tmppath, stat.st_uid, stat.st_gid)
+            except OSError:
+                pass
+        os.rename(tmppath, path)
+    except:
+        os.remove(tmppath)
+        raise
+
+
+if __name__ == '__main__':
+    action, path, block_size = sys.argv[1], sys.argv[2], int(sys.argv[3])
+    if action == 'signature':
+        signature(path, block_size, getattr(sys.stdout, 'buffer', sys.stdout))
+    else:
+        patch(path, block_size, getattr(sys.stdin, 'buffer', sys.stdin))
+'''
+
+_LOCAL = {'__name__': __name__}
+exec(compile(_SCRIPT, '<unix.delta>', 'exec'), _LOCAL)
+
+
+def _inprocess(host):
+    """Whether the code can be executed in this process for **host**."""
+    return unix.ishost(host, 'Local') and not unix.ishost(host, 'Chroot')
+
+
+def _script(host, action, path, block_size):
+    with host.set_controls(escape_args=True):
+        return host.popen(host._python(), '-c', _SCRIPT, action, path, str(block_size))
+
+
+def signatures(host, path, block_size=BLOCK_SIZE):
+    """Return the list of (weak checksum, strong checksum) of the blocks of
+    **path** on **host** (an empty list if the file doesn't exist)."""
+    if _inprocess(host):
+        out = io.BytesIO()
+        _LOCAL['signature'](path, block_size, out)
+        data = out.getvalue()
+    else:
+        process = _script(host, 'signature', path, block_size)
+        process.stdin.close()
+        data = process.stdout.read()
+        if process.wait() != 0:
+            raise unix.UnixError(process.stderr.read().decode().strip())
+
+    return [(struct.unpack('>I', data[offset:offset + 4])[0],
+             data[offset + 4:offset + _SIGNATURE_SIZE])
+            for offset in range(0, len(data), _SIGNATURE_SIZE)]
+
+
+def delta(data, signatures, block_size=BLOCK_SIZE):
+    """Generate the operations for rebuilding **data** from the file whose
+    blocks have the given **signatures**. Operations are tuples
+    ``('R', index)`` (copy block **index** of the old file) or ``('D', data)``
+    (literal data)."""
+    blocks = {}
+    for index, (weak, strong) in enumerate(signatures):
+        blocks.setdefault(weak, {}).setdefault(strong, index)
+
+    def match(start, end):
+        candidates = blocks.get(weak)
+        if candidates:
+            return candidates.get(hashlib.md5(view[start:end]).digest())
+
+    data = bytearray(data)
+    view = memoryview(data)
+    size = len(data)
+    literal = position = 0
+    weak = None
+    while position + block_size <= size:
+        if weak is None:
+            weak = zlib.adler32(view[position:position + block_size]) & 0xffffffff
+            low, high = weak & 0xffff, weak >> 16
+
+        index = match(position, position + block_size)
+        if index is not None:
+            if literal < position:
+                yield ('D', bytes(data[literal:position]))
+            yield ('R', index)
+            position += block_size
+            literal = position
+            weak = None
+            continue
+
+        if position + block_size == size:
+            break
+        # Roll the checksum by one byte.
+        byte_out, byte_in = data[position], data[position + block_size]
+        low = (low - byte_out + byte_in) % _ADLER_MOD
+        high = (high - block_size * byte_out + low - 1) % _ADLER_MOD
+        weak = (high << 16) | low
+        position += 1
+        if position - literal >= _LITERAL_MAX:
+            yield ('D', bytes(data[literal:position]))
+            literal = position
+    else:
+        # The last block of the old file may be smaller than others.
+        if position < size:
+            weak = zlib.adler32(view[position:]) & 0xffffffff
+            index = match(position, size)
+            if index is not None:
+                if literal < position:
+                    yield ('D', bytes(data[literal:position]))
+                yield ('R', index)
+                literal = size
+
+    for offset in range(literal, size, _LITERAL_MAX):
+        yield ('D', bytes(data[offset:offset + _LITERAL_MAX]))
+
+
+def encode(operations):
+    """Encode delta operations for the ``patch`` script."""
+    for op, value in operations:
+        if op == 'R':
+            yield b'R' + struct.pack('>I', value)
+        else:
+            yield b'D' + struct.pack('>I', len(value))
+            yield value
+    yield b'E'
+
+
+def patch(host, path, chunks, block_size=BLOCK_SIZE):
+    """Rebuild **path** on **host** from the encoded delta **chunks**. The new
+    file replaces the old one atomically."""
+    if _inprocess(host):
+        _LOCAL['patch'](path, block_size, io.BytesIO(b''.join(chunks)))
+        return
+
+    process = _script(host, 'patch', path, block_size)
+    try:
+        for chunk in chunks:
+            process.stdin.write(chunk)
+    finally:
+        process.stdin.close()
+        if process.wait() != 0:
+            raise unix.UnixError(process.stderr.read().decode().strip())
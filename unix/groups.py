@@ -1,23 +1,31 @@
-# /etc/group fields.
-_GROUP_FIELDS = ('name', 'password', 'gid', 'users')
+import unix
+from unix.accounts import (GROUP_FIELDS as _GROUP_FIELDS, snapshot,
+                           invalidate, run)
+
 
 class Groups(object):
+    """Groups of a host. Lookups are done on a snapshot of the users and
+    groups databases (see ``unix.accounts``) which is loaded once and
+    invalidated when users or groups are modified through the host."""
     def __init__(self, host):
         self._host = host
 
+    def refresh(self):
+        invalidate(self._host)
+
     def list(self, verbose=False):
-        with self._host.set_controls(decode='utf-8'):
-            status, stdout, stderr = self._host.execute('getent', 'passwd')
-        if not status:
-            raise UnixError(stderr)
-        return [dict(zip(_GROUP_FIELDS, group.split(':')))['name']
-                for group in stdout.splitlines()]
+        return list(snapshot(self._host).groups)
 
     def get(self, gid):
+        group = snapshot(self._host).group(gid)
+        if group is not None:
+            return dict(group)
+
+        # Groups that can't be enumerated (from a directory for example).
         with self._host.set_controls(decode='utf-8'):
             status, stdout, stderr = self._host.execute('getent', 'group', gid)
         if not status:
-            raise UnixError(stderr)
+            raise unix.UnixError(stderr)
         return dict(zip(_GROUP_FIELDS, stdout.splitlines()[0].split(':')))
 
     def gid(self, groupname):
@@ -27,15 +35,46 @@ class Groups(object):
         return self.get(gid)['name']
 
     def add(self, group, **kwargs):
+        invalidate(self._host)
         return self._host.execute('groupadd', group, **kwargs)
 
     def delete(self, group):
+        invalidate(self._host)
         return self._host.execute('groupdel', group)
 
     def update(self, group, **kwargs):
+        invalidate(self._host)
         return self._host.execute('groupmod', group, **kwargs)
 
     def users(self, groupname):
-        for group in self.list():
-            if group['name'] == groupname:
-                return group['users']
+        users = snapshot(self._host).group_users(groupname)
+        if users is None:
+            raise unix.UnixError("unknown group '%s'" % groupname)
+        return users
+
+    def apply(self, spec):
+        """Make groups of the host match **spec**, a dictionary associating
+        group names to their attributes (``gid`` and ``users``, the list of
+        members) or to *None* for deleting the group. Only attributes that
+        differ from the current groups are changed, with one script for all
+        groups."""
+        accounts = snapshot(self._host)
+        commands = []
+        for name, attrs in sorted(spec.items()):
+            group = accounts.groups.get(name)
+            if attrs is None:
+                if group is not None:
+                    commands.append(['groupdel', name])
+                continue
+
+            gid = attrs.get('gid')
+            if group is None:
+                commands.append(['groupadd'] + (['-g', gid] if gid is not None else []) + [name])
+            elif gid is not None and str(gid) != group['gid']:
+                commands.append(['groupmod', '-g', gid, name])
+
+            users = attrs.get('users')
+            current = group['users'].split(',') if group is not None else []
+            if users is not None and set(users) != set(filter(None, current)):
+                commands.append(['gpasswd', '-M', ','.join(users), name])
+        return run(self._host, commands)
@@ -0,0 +1,94 @@
+"""Minimal binding (using ``ctypes``) of Linux ``inotify`` API."""
+import os
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+
+# Events.
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_IGNORED = 0x00008000
+
+# Flags of 'inotify_init1'.
+_IN_CLOEXEC = 0o2000000
+
+# Header of an event (wd, mask, cookie, len) followed by the name.
+_EVENT = struct.Struct('iIII')
+
+
+class InotifyError(Exception):
+    pass
+
+
+def _libc():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        libc.inotify_init1
+    except (OSError, AttributeError):
+        raise InotifyError('inotify is not available')
+    return libc
+
+
+class Inotify(object):
+    def __init__(self):
+        self._libc = _libc()
+        self.fd = self._libc.inotify_init1(_IN_CLOEXEC)
+        if self.fd < 0:
+            raise InotifyError(os.strerror(ctypes.get_errno()))
+
+    def fileno(self):
+        return self.fd
+
+    def add_watch(self, path, mask):
+        """Watch **path** for events of **mask** and return the watch
+        descriptor."""
+        if not isinstance(path, bytes):
+            path = path.encode()
+        wd = self._libc.inotify_add_watch(self.fd, path, mask)
+        if wd < 0:
+            raise InotifyError(os.strerror(ctypes.get_errno()))
+        return wd
+
+    def rm_watch(self, wd):
+        self._libc.inotify_rm_watch(self.fd, wd)
+
+    def read(self, timeout=None):
+        """Wait at most **timeout** seconds for events and return the list of
+        events as (wd, mask, cookie, name) tuples."""
+        try:
+            if not select.select([self.fd], [], [], timeout)[0]:
+                return []
+        except select.error as err:
+            if err.args[0] == errno.EINTR:
+                return []
+            raise
+        data = os.read(self.fd, 65536)
+
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            events.append((wd, mask, cookie, name.decode()))
+        return events
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
@@ -27,9 +27,9 @@ _RELEASE_VERSION_RE = re.compile(r'([^0-9]+)'
                                   '(?: release )?'
                                   '([\d.]+)'
                                   '[^(]*(?:\((.+)\))?')
-_DISTRIBUTOR_ID_FILE_RE = re.compile(r'(?:DISTRIB_ID\s*=)\s*(.*)', re.I)
-_RELEASE_FILE_RE = re.compile(r'(?:DISTRIB_RELEASE\s*=)\s*(.*)', re.I)
-_CODENAME_FILE_RE = re.compile(r'(?:DISTRIB_CODENAME\s*=)\s*(.*)', re.I)
+_DISTRIBUTOR_ID_FILE_RE = re.compile(br'(?:DISTRIB_ID[ \t]*=)[ \t]*(.*)', re.I)
+_RELEASE_FILE_RE = re.compile(br'(?:DISTRIB_RELEASE[ \t]*=)[ \t]*(.*)', re.I)
+_CODENAME_FILE_RE = re.compile(br'(?:DISTRIB_CODENAME[ \t]*=)[ \t]*(.*)', re.I)
 
 _SUPPORTED_DISTS = ('SuSE', 'debian', 'fedora', 'redhat', 'centos', 'mandrake',
                     'mandriva', 'rocks', 'slackware', 'yellowdog', 'gentoo',
@@ -55,20 +55,14 @@ def distribution(host):
     # Check for the Debian/Ubuntu /etc/lsb-release file first, needed
     # so that the distribution doesn't get identified as Debian.
     if host.path.exists('/etc/lsb-release'):
-        with host.open('/etc/lsb-release') as fhandler:
-            _u_distname, _u_version = u'', u''
-            for line in fhandler.read().splitlines():
-                regex = _DISTRIBUTOR_ID_FILE_RE.search(line.decode())
-                if regex is not None:
-                    _u_distname = regex.group(1).strip()
-                regex = _RELEASE_FILE_RE.search(line.decode())
-                if regex is not None:
-                    _u_version = regex.group(1).strip()
-                regex = _CODENAME_FILE_RE.search(line.decode())
-                if regex is not None:
-                    _u_name = regex.group(1).strip()
-            if _u_distname and _u_version:
-                return (_u_distname, _u_version, _u_name)
+        with host.read_view('/etc/lsb-release') as view:
+            _u_distname, _u_version, _u_name = [
+                regex.group(1).strip().decode() if regex is not None else u''
+                for regex in (_DISTRIBUTOR_ID_FILE_RE.search(view),
+                              _RELEASE_FILE_RE.search(view),
+                              _CODENAME_FILE_RE.search(view))]
+        if _u_distname and _u_version:
+            return (_u_distname, _u_version, _u_name)
 
     # Get etc file of the distribution.
     for filename in sorted(host.listdir('/etc')):
@@ -225,6 +219,8 @@ def Chroot(host, root):
             host.__class__.__init__(self)
             self.__dict__.update(host.__dict__)
             self.root = root
+            # Users and groups of the chroot are not the ones of the host.
+            self._accounts = None
 
         @property
         def chrooted(self):
@@ -239,11 +235,22 @@ def Chroot(host, root):
             self.return_code = host.return_code
             return result
 
-        def open(self, filepath, mode='r'):
+        def popen(self, cmd, *args, **kwargs):
+            if self.root:
+                cmd = 'chroot %s %s' % (self.root, cmd)
+            return host.popen(cmd, *args, **kwargs)
+
+        def _root_path(self, filepath):
             if self.root:
                 filepath = filepath[1:] if filepath.startswith('/') else filepath
                 filepath = os.path.join(self.root, filepath)
-            return host.open(filepath, mode)
+            return filepath
+
+        def open(self, filepath, mode='r', **kwargs):
+            return host.open(self._root_path(filepath), mode, **kwargs)
+
+        def atomic_open(self, filepath, mode='w'):
+            return host.atomic_open(self._root_path(filepath), mode)
 
         @contextmanager
         def set_controls(self, **controls):
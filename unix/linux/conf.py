@@ -2,12 +2,22 @@ import os
 import crypt
 import random
 import string
+import hashlib
+import multiprocessing
 from datetime import datetime
 
 _SHADOW_FILE = '/etc/shadow'
 _SSH_DIR = '/etc/ssh'
 _SALT_CHOICES = string.ascii_letters + string.digits
 
+# Salts are generated from the system (the state of 'random' is shared by
+# processes of the pool).
+_RANDOM = random.SystemRandom()
+
+# Hashed passwords by digest of the clear password, so a password set on many
+# hosts (or many users) is hashed only once.
+_HASHES = {}
+
 _HOSTS_CONTENT= """127.0.0.1    localhost
 $(IP)   $(HOSTNAME).$(DOMAIN)   $(HOSTNAME)
 
@@ -19,6 +29,32 @@ ff02::1 ip6-allnodes
 ff02::2 ip6-allrouters
 """
 
+def _crypt(password):
+    salt = ''.join([_RANDOM.choice(_SALT_CHOICES) for _ in range(0,8)])
+    return crypt.crypt(password, '$6$%s$' % salt)
+
+
+def hash_passwords(passwords, parallel=None):
+    """Return the SHA-512 crypt hashes of **passwords** (in the same order).
+    Passwords that were not already hashed are hashed in a pool of
+    **parallel** processes (the number of CPUs by default)."""
+    digests = [hashlib.sha512(password.encode()).digest() for password in passwords]
+    missing = dict((digest, password)
+                   for digest, password in zip(digests, passwords)
+                   if digest not in _HASHES)
+    if len(missing) > 1 and parallel != 1:
+        pool = multiprocessing.Pool(parallel)
+        try:
+            hashes = pool.map(_crypt, list(missing.values()))
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        hashes = [_crypt(password) for password in missing.values()]
+    _HASHES.update(zip(missing, hashes))
+    return [_HASHES[digest] for digest in digests]
+
+
 class Conf:
     def __init__(self, host):
         self._host = host
@@ -34,33 +70,35 @@ class Conf:
             return [False, u'', err]
 
     def set_password(self, username, password):
-        # Hash password.
-        salt = ''.join([random.choice(_SALT_CHOICES) for _ in range(0,8)])
-        hashed_pwd = crypt.crypt(password, '$6$%s$' % salt)
-        user_line = ':'.join((username, hashed_pwd,
-                              str((datetime.today() - datetime(1970, 1, 1)).days),
-                              '0', '99999', '7', '', '', ''))
+        return self.set_passwords({username: password})
+
+    def set_passwords(self, passwords, parallel=None):
+        """Set the passwords of many users (**passwords** is a dictionary
+        associating users to their clear password). Passwords are hashed in
+        **parallel** processes and the shadow file is rewritten only once."""
+        usernames = sorted(passwords)
+        hashes = hash_passwords([passwords[username] for username in usernames],
+                                parallel)
+        lastchg = str((datetime.today() - datetime(1970, 1, 1)).days)
+        user_lines = dict((username.encode(),
+                           ':'.join((username, hashed_pwd, lastchg,
+                                     '0', '99999', '7', '', '', '')).encode())
+                          for username, hashed_pwd in zip(usernames, hashes))
 
         # Generate the new content of the shadow file.
-        content = []
-        in_file = False
-        with self._host.open(_SHADOW_FILE) as fhandler:
-            for line in fhandler.read().splitlines():
-                line = line.decode()
-                if line.split(':')[0] == username:
-                    content.append(user_line)
-                    in_file = True
-                else:
-                    content.append(line)
-            if not in_file:
-                content.append(user_line)
+        lines = []
+        with self._host.read_view(_SHADOW_FILE) as view:
+            for line in bytes(view).splitlines():
+                username = line.split(b':', 1)[0]
+                lines.append(user_lines.pop(username, line))
+        lines.extend(user_lines[username] for username in sorted(user_lines))
 
         # Write content to the file.
         try:
-            with self._host.open(_SHADOW_FILE, 'w') as fhandler:
-                fhandler.write(u'\n'.join(content))
+            with self._host.atomic_open(_SHADOW_FILE) as fhandler:
+                fhandler.write(b'\n'.join(lines) + b'\n')
             return [True, u'', u'']
-        except OSError as err:
+        except (IOError, OSError) as err:
             return [False, u'', err]
 
     def gen_ssh_keys(self, algos=['rsa', 'dsa']):
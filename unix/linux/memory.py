@@ -3,16 +3,17 @@ from unix.sizes import kb2b
 
 _MEMINFO = '/proc/meminfo'
 
-_PARAM_RE = re.compile(r'^(?P<param>[a-zA-Z0-9_]*)(\((?P<anon>\w*)\))?:'
-                        '\s+(?P<value>\d*)(\s+(?P<unit>\w*))?$')
+_PARAM_RE = re.compile(br'^(?P<param>[a-zA-Z0-9_]*)(\((?P<anon>\w*)\))?:'
+                       br'[ \t]+(?P<value>\d*)([ \t]+(?P<unit>\w*))?$', re.M)
 
 class Memory(object):
     def __init__(self, host):
         self._host = host
 
-        with self._host.open(_MEMINFO) as fhandler:
-            for line in fhandler.read().splitlines():
-                regex = _PARAM_RE.search(line.decode()).groupdict()
+        with self._host.read_view(_MEMINFO) as view:
+            for regex in _PARAM_RE.finditer(view):
+                regex = {key: value.decode() if value is not None else value
+                         for key, value in regex.groupdict().items()}
                 param = regex['param'].lower()
                 if param.startswith('mem'):
                     param = param[3:]
@@ -1,3 +1,237 @@
+import os
+import time
+import unix
+from unix.accounts import snapshot as _accounts
+
+#
+# Constants.
+#
+# Output format of 'ps' for snapshots of the processes table (the name of the
+# command is truncated to 16 characters and padded so arguments can be split
+# from it).
+_PS_FORMAT = 'pid=,ppid=,uid=,state=,rss=,time=,comm:16=,args='
+_PS_COMM_WIDTH = 16
+
+# Shell script run (as one long-running command) by ``monitor`` on remote
+# hosts. After a header line with the clock ticks and the page size, it emits
+# frames of the stat files of all processes, starting with the uptime of the
+# host and ending with an 'E' line.
+_MONITOR_SCRIPT = '''echo $(getconf CLK_TCK) $(getconf PAGESIZE)
+while :; do
+    read uptime idle < /proc/uptime
+    echo "S $uptime"
+    cat /proc/[0-9]*/stat 2>/dev/null
+    echo E
+    sleep %s
+done'''
+
+# Shell script run by ``signal_matching``. Arguments are the signal, the
+# number of tenths of seconds to wait before escalating, the escalation
+# signal (may be empty) and then either '-p' followed by pids or 'pgrep'
+# arguments. The shell running the script and its parent are excluded from
+# the matched processes.
+_SIGNAL_SCRIPT = '''sig=$1 ticks=$2 to=$3; shift 3
+if [ "$1" = -p ]; then
+    shift; pids="$*"
+else
+    pids=$(pgrep "$@" | grep -v -x -e $$ -e $PPID)
+fi
+echo matched $pids
+[ -n "$pids" ] || exit 0
+kill -$sig $pids 2>/dev/null
+alive() {
+    r=; for p in $pids; do kill -0 $p 2>/dev/null && r="$r $p"; done; pids=$r
+}
+waitfor() {
+    n=$1
+    while alive && [ -n "$pids" ] && [ $n -gt 0 ]; do sleep 0.1; n=$((n - 1)); done
+}
+waitfor $ticks
+if [ -n "$pids" ] && [ -n "$to" ]; then
+    echo escalated $pids
+    kill -$to $pids 2>/dev/null
+    waitfor 10
+fi
+echo remaining $pids'''
+
+
+#
+# Process records.
+#
+class Process(object):
+    """A process of a processes table. **rss** is in kilobytes and **time**
+    (the CPU time) in seconds."""
+    __slots__ = ('pid', 'ppid', 'uid', 'state', 'rss', 'time', 'name', 'cmdline')
+
+    def __init__(self, pid, ppid, uid, state, rss, time, name, cmdline):
+        self.pid = pid
+        self.ppid = ppid
+        self.uid = uid
+        self.state = state
+        self.rss = rss
+        self.time = time
+        self.name = name
+        self.cmdline = cmdline
+
+    def __repr__(self):
+        return '<Process %d %s>' % (self.pid, self.name)
+
+
+class ProcessSample(object):
+    """CPU usage (in percent) and resident memory (and its variation since
+    the previous sample, in kilobytes) of a process between two samples."""
+    __slots__ = ('pid', 'name', 'cpu', 'rss', 'rss_delta')
+
+    def __init__(self, pid, name, cpu, rss, rss_delta):
+        self.pid = pid
+        self.name = name
+        self.cpu = cpu
+        self.rss = rss
+        self.rss_delta = rss_delta
+
+    def __repr__(self):
+        return '<ProcessSample %d %s cpu=%.1f%% rss=%d>' % (
+            self.pid, self.name, self.cpu, self.rss)
+
+
+class ProcessTable(object):
+    """Snapshot of the processes of a host indexed by pid, name, user and
+    parent."""
+    def __init__(self, host, processes):
+        self._host = host
+        self._pids = {}
+        self._names = {}
+        self._uids = {}
+        self._children = {}
+        for process in processes:
+            self._pids[process.pid] = process
+            self._names.setdefault(process.name, []).append(process)
+            self._uids.setdefault(process.uid, []).append(process)
+            self._children.setdefault(process.ppid, []).append(process)
+
+    def __len__(self):
+        return len(self._pids)
+
+    def __iter__(self):
+        return iter(self._pids.values())
+
+    def __contains__(self, pid):
+        return pid in self._pids
+
+    def __getitem__(self, pid):
+        return self._pids[pid]
+
+    def get(self, pid, default=None):
+        return self._pids.get(pid, default)
+
+    def pids(self):
+        return list(self._pids)
+
+    def by_name(self, name):
+        return list(self._names.get(name, []))
+
+    def by_user(self, user):
+        """Return processes of **user** (a login or an uid)."""
+        if not isinstance(user, int):
+            user = _accounts(self._host).user(user)
+            if user is None:
+                return []
+            user = int(user['uid'])
+        return list(self._uids.get(user, []))
+
+    def children(self, pid):
+        return list(self._children.get(pid, []))
+
+    def tree(self, pid):
+        """Return all the descendants of process **pid**."""
+        descendants = []
+        parents = [pid]
+        while parents:
+            children = [child
+                        for parent in parents
+                        for child in self._children.get(parent, [])
+                        if child.pid != parent]
+            descendants.extend(children)
+            parents = [child.pid for child in children]
+        return descendants
+
+
+#
+# Utils functions.
+#
+def _cputime(value):
+    """Convert a '[dd-]hh:mm:ss' time of 'ps' to seconds."""
+    days, _, value = value.rpartition('-')
+    seconds = 0
+    for part in value.split(':'):
+        seconds = seconds * 60 + int(part)
+    return float(seconds + int(days or 0) * 86400)
+
+
+def _parse_stat(data):
+    """Parse the content of '/proc/<pid>/stat' and return the name and the
+    remaining fields (starting with the state)."""
+    start, end = data.index(b'('), data.rindex(b')')
+    return data[start + 1:end].decode('utf-8', 'replace'), data[end + 2:].split()
+
+
+def _proc_stats():
+    """Return the content of the stat files of the local processes."""
+    stats = []
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open('/proc/%s/stat' % entry, 'rb') as fhandler:
+                    stats.append(fhandler.read())
+            except (IOError, OSError):
+                continue
+    return stats
+
+
+def _remote_stats(process):
+    """Generate (uptime, stat files) from the frames of the monitoring script
+    run by **process**."""
+    while True:
+        line = process.stdout.readline()
+        if not line:
+            return
+        if not line.startswith(b'S '):
+            continue
+        uptime, stats = float(line.split()[1]), []
+        for line in iter(process.stdout.readline, b''):
+            if line.rstrip() == b'E':
+                break
+            stats.append(line)
+        else:
+            return
+        yield uptime, stats
+
+
+def _proc_snapshot():
+    """Read the processes table from the local '/proc' in one pass."""
+    clk_tck = float(os.sysconf('SC_CLK_TCK'))
+    page_size = os.sysconf('SC_PAGE_SIZE') // 1024
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        path = '/proc/%s' % entry
+        try:
+            uid = os.stat(path).st_uid
+            with open(path + '/stat', 'rb') as fhandler:
+                name, fields = _parse_stat(fhandler.read())
+            with open(path + '/cmdline', 'rb') as fhandler:
+                cmdline = fhandler.read()
+        except (IOError, OSError):
+            # The process has exited.
+            continue
+        cmdline = (cmdline.rstrip(b'\0').replace(b'\0', b' ').decode('utf-8', 'replace')
+                   or '[%s]' % name)
+        yield Process(int(entry), int(fields[1]), uid, fields[0].decode(),
+                      int(fields[21]) * page_size,
+                      (int(fields[11]) + int(fields[12])) / clk_tck,
+                      name, cmdline)
+
+
 #
 # Class for managing process.
 #
@@ -7,3 +241,121 @@ class Processes(object):
 
     def kill(self, pid, signal=15):
         return self._host.execute('kill', pid, s=signal)
+
+    def signal_matching(self, pattern=None, user=None, pids=None, signal=15,
+                        escalate_after=5, to=9):
+        """Send **signal** to processes whose command line match **pattern**
+        (and/or which belong to **user**) or to **pids**, wait at most
+        **escalate_after** seconds for them to exit and send **to** signal
+        (if not *None*) to the remaining ones. Everything is done on the host
+        with one command. Return a dictionnary with the ``matched``,
+        ``escalated`` and ``remaining`` pids."""
+        if pids is not None:
+            select = ['-p'] + [str(pid) for pid in pids]
+        elif pattern is None and user is None:
+            raise unix.UnixError('a pattern, an user or pids is required')
+        else:
+            select = ((['-u', str(user)] if user is not None else [])
+                      + (['-f', pattern] if pattern is not None else []))
+
+        def signum(value):
+            value = str(int(value) if not isinstance(value, str) else value)
+            return value[3:] if value.startswith('SIG') else value
+
+        with self._host.set_controls(escape_args=True, decode='utf-8'):
+            status, stdout, stderr = self._host.execute(
+                'sh', '-c', _SIGNAL_SCRIPT, 'sh', signum(signal),
+                str(int(escalate_after * 10)), signum(to) if to is not None else '',
+                *select)
+        if not status:
+            raise unix.UnixError(stderr)
+
+        result = {'matched': [], 'escalated': [], 'remaining': []}
+        for line in stdout.splitlines():
+            fields = line.split()
+            if fields and fields[0] in result:
+                result[fields[0]] = [int(pid) for pid in fields[1:]]
+        return result
+
+    def snapshot(self):
+        """Return a ``ProcessTable`` of the processes of the host. Local hosts
+        read ``/proc`` directly, others use one ``ps`` command."""
+        if unix.ishost(self._host, 'Local') and os.path.isdir('/proc/self'):
+            return ProcessTable(self._host, _proc_snapshot())
+
+        with self._host.set_controls(decode='utf-8'):
+            status, stdout, stderr = self._host.execute('ps', '-e', '-ww',
+                                                        '-o', _PS_FORMAT)
+        if not status:
+            raise unix.UnixError(stderr)
+
+        processes = []
+        for line in stdout.splitlines():
+            fields = line.split(None, 6)
+            if len(fields) != 7:
+                continue
+            pid, ppid, uid, state, rss, time, rest = fields
+            processes.append(Process(int(pid), int(ppid), int(uid), state,
+                                     int(rss), _cputime(time),
+                                     rest[:_PS_COMM_WIDTH].rstrip(),
+                                     rest[_PS_COMM_WIDTH + 1:]))
+        return ProcessTable(self._host, processes)
+
+    def monitor(self, interval=1, top=10, key='cpu', count=None):
+        """Sample processes every **interval** seconds and generate, for each
+        sample (after the first one), the **top** processes (all if *None*)
+        sorted by **key** (``cpu``, ``rss`` or ``rss_delta``) as
+        ``ProcessSample`` objects. Local hosts read ``/proc`` directly, other
+        hosts run one long-running command emitting samples. Stop after
+        **count** samples if it is set."""
+        if unix.ishost(self._host, 'Local'):
+            clk_tck = float(os.sysconf('SC_CLK_TCK'))
+            page_size = os.sysconf('SC_PAGE_SIZE') // 1024
+
+            def samples():
+                while True:
+                    yield time.time(), _proc_stats()
+                    time.sleep(interval)
+            process = None
+            stats = samples()
+        else:
+            with self._host.set_controls(escape_args=True):
+                process = self._host.popen('sh', '-c', _MONITOR_SCRIPT % interval)
+            header = process.stdout.readline().split()
+            if len(header) != 2:
+                process.kill()
+                raise unix.UnixError(process.stderr.read().decode().strip())
+            clk_tck, page_size = float(header[0]), int(header[1]) // 1024
+            stats = _remote_stats(process)
+
+        try:
+            previous = None
+            for timestamp, sample in stats:
+                current = {}
+                for data in sample:
+                    try:
+                        name, fields = _parse_stat(data)
+                        current[int(data.split(None, 1)[0])] = (
+                            name, int(fields[11]) + int(fields[12]),
+                            int(fields[21]) * page_size)
+                    except (ValueError, IndexError):
+                        continue
+
+                if previous is not None:
+                    elapsed = (timestamp - previous[0]) or interval
+                    results = []
+                    for pid, (name, ticks, rss) in current.items():
+                        _, prev_ticks, prev_rss = previous[1].get(pid, (name, ticks, rss))
+                        results.append(ProcessSample(
+                            pid, name, (ticks - prev_ticks) / clk_tck / elapsed * 100,
+                            rss, rss - prev_rss))
+                    results.sort(key=lambda result: getattr(result, key), reverse=True)
+                    yield results[:top] if top is not None else results
+                    if count is not None:
+                        count -= 1
+                        if count <= 0:
+                            return
+                previous = (timestamp, current)
+        finally:
+            if process is not None:
+                process.kill()
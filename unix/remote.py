@@ -1,4 +1,20 @@
+import os
+import sys
+import time
+import threading
 import unix
+import unix.delta
+from multiprocessing.pool import ThreadPool
+
+if sys.version_info.major < 3:
+    from pipes import quote
+else:
+    from shlex import quote
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 
 # Extra arguments for 'scp' command as integer argument name raise syntax error
 # when there are passed directly but not in kwargs.
@@ -11,6 +27,155 @@ _SCP_EXTRA_ARGS = {'force_protocol1': '1',
 # Set some default value for SSH options of 'scp' command.
 _SCP_DEFAULT_OPTS = {'StrictHostKeyChecking': 'no', 'ConnectTimeout': '2'}
 
+# Size of the chunks read from source files and maximum number of chunks
+# waiting for being written to destination files when transferring files
+# between hosts.
+_TRANSFER_CHUNK_SIZE = 1048576
+_TRANSFER_BUFFERS = 8
+
+# Commands for compressing and decompressing tar streams.
+_COMPRESSIONS = {'none': ('', ''),
+                 'gzip': ('gzip -c', 'gzip -dc'),
+                 'zstd': ('zstd -c -q -T0', 'zstd -dc -q'),
+                 'lz4': ('lz4 -c -q', 'lz4 -dc -q')}
+
+# Compressions methods, by order of preference, when the compression of a tar
+# stream between two hosts is automatically selected.
+_AUTO_COMPRESSIONS = ('zstd', 'lz4', 'gzip')
+
+
+def _walk(host, path):
+    """Return the relative paths of directories and files under **path**."""
+    result = []
+    for filetype in ('d', 'f'):
+        with host.set_controls(decode='utf-8'):
+            status, stdout, stderr = host.execute('find', path, '-type', filetype)
+        if not status:
+            raise OSError(stderr)
+        result.append([os.path.relpath(filepath, path)
+                       for filepath in stdout.splitlines()])
+    return result
+
+
+def _iter_file(fhandler, chunk_size):
+    """Iterate on the content of an opened file by chunks of **chunk_size**
+    bytes."""
+    # For SFTP files, pipeline read requests by windows of 'chunk_size' bytes
+    # (pseudo-files have a null size and are read normally).
+    size = fhandler.stat().st_size if hasattr(fhandler, 'readv') else 0
+    if size:
+        requests = [(offset, min(unix._SFTP_CHUNK_SIZE, size - offset))
+                    for offset in range(0, size, unix._SFTP_CHUNK_SIZE)]
+        window = max(1, chunk_size // unix._SFTP_CHUNK_SIZE)
+        for index in range(0, len(requests), window):
+            yield b''.join(fhandler.readv(requests[index:index + window]))
+        return
+
+    while True:
+        data = fhandler.read(chunk_size)
+        if not data:
+            return
+        yield data
+
+
+def _pump(chunks, write, buffers, progress, name):
+    """Write with **write** the data generated by **chunks**. Chunks are
+    generated in a separate thread and at most **buffers** chunks are waiting
+    to be written."""
+    queued = queue.Queue(buffers)
+
+    def reader():
+        try:
+            for data in chunks:
+                if data:
+                    queued.put(data)
+            queued.put(b'')
+        except Exception as err:
+            queued.put(err)
+
+    thread = threading.Thread(target=reader)
+    thread.daemon = True
+    thread.start()
+
+    nbytes = 0
+    try:
+        while True:
+            data = queued.get()
+            if isinstance(data, Exception):
+                raise data
+            if not data:
+                break
+            write(data)
+            nbytes += len(data)
+            progress(name, nbytes, len(data))
+    finally:
+        # Unblock the reader if the writer failed.
+        while thread.is_alive():
+            try:
+                queued.get(timeout=0.1)
+            except queue.Empty:
+                pass
+    return nbytes
+
+
+def _copy_file(src_host, src_path, dst_host, dst_path, chunk_size, buffers,
+               progress):
+    """Copy a file between two hosts."""
+    def chunks():
+        with src_host.open(src_path) as fhandler:
+            for data in _iter_file(fhandler, chunk_size):
+                yield data
+
+    with dst_host.open(dst_path, 'w') as fhandler:
+        if hasattr(fhandler, 'set_pipelined'):
+            fhandler.set_pipelined(True)
+        return _pump(chunks(), fhandler.write, buffers, progress, src_path)
+
+
+def _compression(src_host, dst_host):
+    """Select the compression of a tar stream between two hosts. There is no
+    compression between local hosts, otherwise the first compression method
+    available on both hosts is used."""
+    if unix.ishost(src_host, 'Local') and unix.ishost(dst_host, 'Local'):
+        return 'none'
+    for compression in _AUTO_COMPRESSIONS:
+        command = _COMPRESSIONS[compression][0].split()[0]
+        if all(host.execute('which', command)[0] for host in (src_host, dst_host)):
+            return compression
+    return 'none'
+
+
+def _tar_stream(src_host, src_path, dst_host, dst_path, compression,
+                chunk_size, buffers, progress):
+    """Stream the archive created by ``tar`` on **src_host** to ``tar``
+    extracting it on **dst_host**. Return the number of bytes streamed."""
+    if compression == 'auto':
+        compression = _compression(src_host, dst_host)
+    if compression not in _COMPRESSIONS:
+        raise unix.UnixError("invalid compression '%s'" % compression)
+    compress, decompress = _COMPRESSIONS[compression]
+
+    src_dir, src_name = os.path.split(os.path.normpath(src_path))
+    src_cmd = 'tar cf - -C %s %s' % (quote(src_dir or '.'), quote(src_name))
+    dst_cmd = 'tar xf - -C %s' % quote(dst_path)
+    if compress:
+        src_cmd = '%s | %s' % (src_cmd, compress)
+        dst_cmd = '%s | %s' % (decompress, dst_cmd)
+
+    src_proc = src_host.popen(src_cmd)
+    dst_proc = dst_host.popen(dst_cmd)
+    try:
+        nbytes = _pump(iter(lambda: src_proc.stdout.read(chunk_size), b''),
+                       dst_proc.stdin.write, buffers, progress, src_path)
+    finally:
+        dst_proc.stdin.close()
+        src_status, dst_status = src_proc.wait(), dst_proc.wait()
+
+    for status, proc in ((src_status, src_proc), (dst_status, dst_proc)):
+        if status != 0:
+            raise unix.UnixError(proc.stderr.read().decode().strip())
+    return compression, nbytes
+
 
 class Remote(object):
     def __init__(self, host):
@@ -65,32 +230,31 @@ class Remote(object):
 
         return self._host.execute('rsync', src, dst, **kwargs)
 
-    def tar(self, src_file, dst_file, src_opts={}, dst_opts={}, **kwargs):
-        src_ssh = '%s' % self._format_ssh_arg(kwargs.pop('src_user', ''),
-                                              kwargs.pop('src_host', ''),
-                                              '')
-        dst_ssh = '%s' % self._format_ssh_arg(kwargs.pop('dst_user', ''),
-                                              kwargs.pop('dst_host', ''),
-                                              '')
+    def tar(self, src_file, dst_file, src_opts=None, dst_opts=None, **kwargs):
+        src_ssh = self._format_ssh_arg(kwargs.pop('src_user', ''),
+                                       kwargs.pop('src_host', ''),
+                                       '')
+        dst_ssh = self._format_ssh_arg(kwargs.pop('dst_user', ''),
+                                       kwargs.pop('dst_host', ''),
+                                       '')
 
         interactive = kwargs.pop('interactive', False)
 
-        src_cmd = ['tar cf -']
-        src_opts.update(kwargs)
+        src_opts = dict(src_opts or {}, **kwargs)
         src_opts.setdefault('C', os.path.dirname(src_file))
-        self._format_command(src_cmd, [os.path.basename(src_file)], src_opts)
+        src_cmd = self._host._format_command('tar cf -',
+                                             [os.path.basename(src_file)],
+                                             src_opts)
 
-        dst_cmd = ['tar xf -']
-        dst_opts.update(kwargs)
+        dst_opts = dict(dst_opts or {}, **kwargs)
         dst_opts.setdefault('C', dst_file)
-        self._format_command(dst_cmd, [], dst_opts)
+        dst_cmd = self._host._format_command('tar xf -', [], dst_opts)
 
-        cmd = ['ssh %s' % src_ssh if src_ssh else '']
-        cmd.extend(src_cmd)
-        cmd.append('|')
-        cmd.append('ssh %s' % dst_ssh if dst_ssh else '')
-        cmd.extend(dst_cmd)
-        return self._host.execute(*cmd, interactive=interactive)
+        cmd = '%s | %s' % ('ssh %s %s' % (src_ssh, quote(src_cmd)) if src_ssh else src_cmd,
+                           'ssh %s %s' % (dst_ssh, quote(dst_cmd)) if dst_ssh else dst_cmd)
+        if interactive:
+            return self._host.interactive(cmd)
+        return self._host.execute(cmd)
 
     def get(self, rmthost, rmtpath, localpath, **kwargs):
         if unix.ishost(self._host, 'Remote') and rmthost == 'localhost':
@@ -129,3 +293,151 @@ class Remote(object):
             return getattr(self, method)(*args, **kwargs)
         except AttributeError:
             return [False, [], ["unknown copy method '%s'" % method]]
+
+    def transfer(self, src_host, src_path, dst_host, dst_path, parallel=1,
+                 callback=None, chunk_size=_TRANSFER_CHUNK_SIZE,
+                 buffers=_TRANSFER_BUFFERS, method='sftp', compression='auto'):
+        """Copy **src_path** (a file or a directory) from **src_host** to
+        **dst_path** on **dst_host** using the existing connections of the
+        hosts (``Local`` or ``Remote`` objects) and without executing any
+        external command for copying data.
+
+        Files are copied by chunks of **chunk_size** bytes with at most
+        **buffers** chunks kept in memory per file and **parallel** files are
+        copied at the same time. If set, **callback** is called after each
+        chunk with the source file, the number of bytes copied for this file
+        and the total number of bytes copied.
+
+        With the *tar* **method**, ``tar`` is executed on both hosts and the
+        archive is streamed from one host to another, which is more efficient
+        for trees of small files. The archive can be compressed with *gzip*,
+        *zstd* or *lz4* (**compression** argument). By default (*auto*), the
+        stream is not compressed between local hosts, otherwise the first of
+        *zstd*, *lz4* and *gzip* available on both hosts is used. **dst_path**
+        is the directory in which **src_path** is extracted.
+
+        Return a dictionnary with the number of files and bytes copied, the
+        duration, the throughput (in bytes/s) and the errors by source file.
+        For the *tar* method, the number of files is not known and the number
+        of bytes is the size of the (compressed) stream.
+        """
+        start = time.time()
+        if method == 'tar':
+            return self._tar_transfer(src_host, src_path, dst_host, dst_path,
+                                      callback, chunk_size, buffers,
+                                      compression, start)
+        elif method != 'sftp':
+            raise unix.UnixError("unknown transfer method '%s'" % method)
+
+        if src_host.path.isdir(src_path):
+            dirs, files = _walk(src_host, src_path)
+            status, _, stderr = dst_host.mkdir(
+                *[os.path.normpath(os.path.join(dst_path, dirpath))
+                  for dirpath in dirs],
+                p=True)
+            if not status:
+                raise OSError(stderr)
+            files = [(os.path.join(src_path, filepath),
+                      os.path.normpath(os.path.join(dst_path, filepath)))
+                     for filepath in files]
+        else:
+            files = [(src_path, dst_path)]
+
+        stats = {'files': 0, 'bytes': 0, 'errors': {}}
+        lock = threading.Lock()
+
+        def progress(filepath, file_bytes, nbytes):
+            with lock:
+                stats['bytes'] += nbytes
+                total_bytes = stats['bytes']
+            if callback is not None:
+                callback(filepath, file_bytes, total_bytes)
+
+        def copy(paths):
+            try:
+                _copy_file(src_host, paths[0], dst_host, paths[1],
+                           chunk_size, buffers, progress)
+                with lock:
+                    stats['files'] += 1
+            except (IOError, OSError, unix.UnixError) as err:
+                with lock:
+                    stats['errors'][paths[0]] = err
+
+        if parallel > 1 and len(files) > 1:
+            pool = ThreadPool(min(parallel, len(files)))
+            try:
+                pool.map(copy, files)
+            finally:
+                pool.close()
+        else:
+            for paths in files:
+                copy(paths)
+
+        stats['seconds'] = time.time() - start
+        stats['rate'] = (stats['bytes'] / stats['seconds']
+                         if stats['seconds']
+                         else 0)
+        return stats
+
+    def _tar_transfer(self, src_host, src_path, dst_host, dst_path, callback,
+                      chunk_size, buffers, compression, start):
+        def progress(filepath, nbytes, _):
+            if callback is not None:
+                callback(filepath, nbytes, nbytes)
+
+        stats = {'files': None, 'bytes': 0, 'errors': {}}
+        try:
+            status, _, stderr = dst_host.mkdir(dst_path, p=True)
+            if not status:
+                raise OSError(stderr)
+            stats['compression'], stats['bytes'] = _tar_stream(
+                src_host, src_path, dst_host, dst_path, compression,
+                chunk_size, buffers, progress)
+        except (IOError, OSError, unix.UnixError) as err:
+            stats['errors'][src_path] = err
+
+        stats['seconds'] = time.time() - start
+        stats['rate'] = (stats['bytes'] / stats['seconds']
+                         if stats['seconds']
+                         else 0)
+        return stats
+
+    def sync(self, src_host, src_path, dst_host, dst_path,
+             block_size=unix.delta.BLOCK_SIZE):
+        """Synchronize the file **dst_path** on **dst_host** with the file
+        **src_path** on **src_host** by sending only the parts of the file
+        that differ (rsync algorithm). Checksums of the blocks of the
+        destination file are computed on the destination host, the file is
+        rebuilt on the destination host and atomically replaced. Only the
+        Python interpreter of the destination host is needed.
+
+        Return a dictionnary with the size of the file, the number of bytes
+        sent as literal data and as block references, the number of bytes
+        saved compared to a full copy and the duration.
+        """
+        start = time.time()
+        signatures = unix.delta.signatures(dst_host, dst_path, block_size)
+        with src_host.open(src_path) as fhandler:
+            data = b''.join(_iter_file(fhandler, _TRANSFER_CHUNK_SIZE))
+
+        stats = {'bytes': len(data), 'literal': 0, 'matched': 0, 'sent': 0}
+
+        def operations():
+            for op, value in unix.delta.delta(data, signatures, block_size):
+                if op == 'R':
+                    stats['matched'] += block_size
+                else:
+                    stats['literal'] += len(value)
+                yield op, value
+
+        def chunks():
+            for chunk in unix.delta.encode(operations()):
+                stats['sent'] += len(chunk)
+                yield chunk
+
+        unix.delta.patch(dst_host, dst_path, chunks(), block_size)
+        # The last matched block may be smaller than the block size.
+        stats['matched'] = stats['bytes'] - stats['literal']
+        stats['saved'] = stats['bytes'] - stats['sent']
+        stats['seconds'] = time.time() - start
+        return stats
@@ -1,23 +1,35 @@
-# /etc/passwd fields.
-_PASSWD_FIELDS = ('login', 'password', 'uid', 'gid', 'name', 'home', 'shell')#
+import unix
+from unix.accounts import (PASSWD_FIELDS as _PASSWD_FIELDS, snapshot,
+                           invalidate, run, chpasswd)
+
+# Options of 'useradd'/'usermod' for each attribute of the users.
+_USER_OPTIONS = (('uid', '-u'), ('gid', '-g'), ('name', '-c'),
+                 ('home', '-d'), ('shell', '-s'), ('groups', '-G'))
+
 
 class Users(object):
+    """Users of a host. Lookups are done on a snapshot of the users and groups
+    databases (see ``unix.accounts``) which is loaded once and invalidated
+    when users or groups are modified through the host."""
     def __init__(self, host):
         self._host = host
 
+    def refresh(self):
+        invalidate(self._host)
+
     def list(self, verbose=False):
-        with self._host.set_controls(decode='utf-8'):
-            status, stdout, stderr = self._host.execute('getent', 'passwd')
-        if not status:
-            raise UnixError(stderr)
-        return [dict(zip(_PASSWD_FIELDS, user.split(':')))['login']
-                for user in stdout.splitlines()]
+        return list(snapshot(self._host).users)
 
     def get(self, uid):
+        user = snapshot(self._host).user(uid)
+        if user is not None:
+            return dict(user)
+
+        # Users that can't be enumerated (from a directory for example).
         with self._host.set_controls(decode='utf-8'):
             status, stdout, stderr = self._host.execute('getent', 'passwd', uid)
         if not status:
-            raise UnixError(stderr)
+            raise unix.UnixError(stderr)
         return dict(zip(_PASSWD_FIELDS, stdout.splitlines()[0].split(':')))
 
     def uid(self, username):
@@ -27,20 +39,81 @@ class Users(object):
         return self.get(uid)['login']
 
     def groups(self, username):
+        gids = snapshot(self._host).user_groups(username)
+        if gids is not None:
+            return gids
+
         with self._host.set_controls(decode='utf-8'):
             status, stdout, stderr = self._host.execute('id', G=username)
         if not status:
-            raise UnixError(stderr)
+            raise unix.UnixError(stderr)
         return [int(gid) for gid in stdout.split()]
 
     def add(self, user, **kwargs):
 #        self._host.isroot('useradd')
+        invalidate(self._host)
         return self._host.execute('useradd', user, **kwargs)
 
     def delete(self, user, **kwargs):
 #        self._host.isroot('userdel')
+        invalidate(self._host)
         return self._host.execute('userdel', user, **kwargs)
 
     def update(self, user, **kwargs):
 #        self._host.isroot('usermod')
+        invalidate(self._host)
         return self._host.execute('usermod', user, **kwargs)
+
+    def apply(self, spec):
+        """Make users of the host match **spec**, a dictionary associating
+        logins to their attributes (``uid``, ``gid``, ``name``, ``home``,
+        ``shell``, ``groups`` and ``password`` which is an already hashed
+        password) or to *None* for deleting the user. Only attributes that
+        differ from the current users are changed, with one script for all
+        users and one ``chpasswd`` for all passwords. Groups must exist
+        (see ``Groups.apply``)."""
+        accounts = snapshot(self._host)
+        commands, passwords = [], {}
+        for login, attrs in sorted(spec.items()):
+            user = accounts.users.get(login)
+            if attrs is None:
+                if user is not None:
+                    commands.append(['userdel', login])
+                continue
+
+            if user is None:
+                changes = [(option, attrs[attr])
+                           for attr, option in _USER_OPTIONS
+                           if attr in attrs]
+                command = 'useradd'
+            else:
+                changes = [(option, attrs[attr])
+                           for attr, option in _USER_OPTIONS
+                           if attr in attrs
+                           and self._differ(accounts, login, user, attr, attrs[attr])]
+                command = 'usermod'
+            if user is None or changes:
+                commands.append([command] + [
+                    arg
+                    for option, value in changes
+                    for arg in (option, ','.join(value) if option == '-G' else value)
+                ] + [login])
+            if attrs.get('password') is not None:
+                passwords[login] = attrs['password']
+
+        if passwords:
+            commands.append(chpasswd(passwords))
+        return run(self._host, commands)
+
+    @staticmethod
+    def _differ(accounts, login, user, attr, value):
+        if attr == 'gid':
+            group = accounts.group(value)
+            return group is None or group['gid'] != user['gid']
+        if attr == 'groups':
+            gids = [accounts.group(group) for group in value]
+            if None in gids:
+                return True
+            return (set(group['gid'] for group in gids)
+                    != set(str(gid) for gid in accounts.user_groups(login)[1:]))
+        return str(value) != user[attr]